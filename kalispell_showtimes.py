@@ -1,13 +1,29 @@
+import codecs
+import gzip
+import hashlib
+import json
+import logging
 import os
+import random
 import re
+import sqlite3
+import threading
 import time
 import cloudscraper
+import orjson
 import requests
-from datetime import date, datetime, timedelta
-from typing import Optional, Dict, List, Tuple
-
-from bs4 import BeautifulSoup
-from flask import Flask, jsonify, request, render_template
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from html import unescape
+from operator import attrgetter
+from datetime import date, datetime
+from typing import Any, Optional, Dict, List, Tuple
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from flask import Flask, Response, request, render_template
 
 # Python 3.9+ has zoneinfo built in
 try:
@@ -15,6 +31,14 @@ try:
 except Exception:
     ZoneInfo = None  # type: ignore
 
+# Brotli (in requirements) lets the index page go out as br; gzip covers the rest
+try:
+    import brotli
+except Exception:
+    brotli = None  # type: ignore
+
+log = logging.getLogger(__name__)
+
 # ------------ CONFIG ------------
 
 TRIBUTE_THEATRE_URL = (
@@ -47,12 +71,30 @@ HEADERS = {
 
 CACHE_TTL_SECONDS = 180
 
-DATE_LABEL_RE = re.compile(r"^(Mon|Tue|Wed|Thu|Fri|Sat|Sun),\s([A-Za-z]{3})\s(\d{1,2}):$")
+GZIP_MIN_BYTES = 1024  # smaller bodies aren't worth the CPU/header overhead
+
+# Refresh the schedule off the request path, every half TTL
+BACKGROUND_REFRESH = os.getenv("BACKGROUND_REFRESH", "1").strip() != "0"
+REFRESH_JITTER_SECONDS = 15
+
+# Ticket date labels look like "Mon, Nov 14:"
+_WEEKDAYS = frozenset(("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"))
 MONTHS = {
     "Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
     "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12
 }
 
+# Section headings on the schedule page that are not movie titles
+_SKIP_HEADINGS = frozenset(("regular showtimes", "showtimes", "coming soon"))
+
+# Title cleanup patterns (compiled once; used on every poster lookup)
+_RE_NONALNUM = re.compile(r"[^a-z0-9]+")
+# ASCII fast path for normalize_title: delete everything but [a-z0-9]
+_NORM_KEEP = frozenset("abcdefghijklmnopqrstuvwxyz0123456789")
+_NORM_DROP = str.maketrans("", "", "".join(chr(c) for c in range(128) if chr(c) not in _NORM_KEEP))
+_RE_MET_OPERA = re.compile(r"^The Metropolitan Opera:\s*", re.IGNORECASE)
+_RE_ENCORE = re.compile(r"\bEncore\b", re.IGNORECASE)
+
 MOUNTAIN_TZ = ZoneInfo("America/Denver") if ZoneInfo else None
 
 # TMDB
@@ -60,9 +102,15 @@ TMDB_API_KEY = os.getenv("TMDB_API_KEY", "").strip()
 TMDB_IMG_BASE = "https://image.tmdb.org/t/p/"
 TMDB_POSTER_SIZE = "w342"  # good balance: sharp but not huge
 
-# Caches (in-memory)
-_poster_cache: Dict[str, Dict] = {}
+# Poster cache (SQLite on disk so restarts/redeploys keep TMDB lookups)
+POSTER_CACHE_PATH = os.getenv("POSTER_CACHE_PATH", "").strip() or os.path.join(
+    os.path.expanduser("~"), ".cache", "kalispell", "posters.sqlite3"
+)
 POSTER_CACHE_TTL_SECONDS = 7 * 24 * 3600  # 7 days
+POSTER_MISS_TTL_SECONDS = 24 * 3600  # "no match" is real but may change
+POSTER_ERROR_TTL_SECONDS = 60  # transient TMDB failures shouldn't stick
+POSTER_REJECTED_TTL_SECONDS = 3600  # other 4xx (bad key, bad query): retrying soon won't help
+POSTER_LOOKUP_WORKERS = 8  # parallel TMDB lookups for uncached titles
 
 
 def now_local() -> datetime:
@@ -71,15 +119,36 @@ def now_local() -> datetime:
     return datetime.now()
 
 
+@lru_cache(maxsize=512)  # same few dozen titles every refresh and poster lookup
 def normalize_title(title: str) -> str:
     t = (title or "").lower()
-    t = re.sub(r"[^a-z0-9]+", "", t)
-    return t
+    if t.isascii():
+        return t.translate(_NORM_DROP)
+    return _RE_NONALNUM.sub("", t)
+
+
+# Titles repeat scrape after scrape; keep one shared copy of each (bounded,
+# oldest dropped first) so refreshed spans don't hold fresh duplicates
+_TITLE_INTERN_MAX = 1024
+_title_intern: Dict[str, str] = {}
+
+
+def _intern_title(s: str) -> str:
+    cached = _title_intern.get(s)
+    if cached is not None:
+        return cached
+    if len(_title_intern) >= _TITLE_INTERN_MAX:
+        _title_intern.pop(next(iter(_title_intern)))
+    _title_intern[s] = s
+    return s
 
 
 # ------------ SCRAPER ------------
 
-def _guess_year(today: date, month: int, day_num: int) -> int:
+@lru_cache(maxsize=512)
+def _guess_year(today_ordinal: int, month: int, day_num: int) -> int:
+    # Keyed on the ordinal so a whole parse collapses to a handful of misses.
+    today = date.fromordinal(today_ordinal)
     candidates = []
     for y in (today.year - 1, today.year, today.year + 1):
         try:
@@ -91,7 +160,7 @@ def _guess_year(today: date, month: int, day_num: int) -> int:
         return today.year
 
     def score(d: date) -> Tuple[int, int]:
-        delta = (d - today).days
+        delta = d.toordinal() - today_ordinal
         in_window = 0 if (-60 <= delta <= 300) else 1
         return (in_window, abs(delta))
 
@@ -99,176 +168,576 @@ def _guess_year(today: date, month: int, day_num: int) -> int:
     return best.year
 
 
-def fetch_tribute_html() -> Tuple[Optional[str], Optional[str], Optional[int], Optional[str]]:
-    scraper = cloudscraper.create_scraper(
-        browser={"browser": "chrome", "platform": "windows", "desktop": True}
-    )
+# The same few dozen labels ("Fri, Nov 28:") repeat under every title, so
+# each distinct text is sliced and looked up in MONTHS once per process.
+@lru_cache(maxsize=512)
+def _parse_date_label(raw: str) -> Optional[Tuple[int, int]]:
+    # Fixed-shape label, so plain slicing beats the regex engine here.
+    if len(raw) < 11 or raw[3:5] != ", " or raw[8] != " " or raw[-1] != ":":
+        return None
+    if raw[:3] not in _WEEKDAYS:
+        return None
+
+    month = MONTHS.get(raw[5:8])
+    day_str = raw[9:-1]
+    if not month or len(day_str) > 2 or not day_str.isdecimal():
+        return None
+    return month, int(day_str)
+
+
+# One scraper per process so keep-alive reuses the TLS connection across
+# retries and cache refreshes instead of handshaking on every fetch.
+# Keep cloudscraper's own https adapter: it carries the cipher suite setup.
+_SCRAPER = None
+_scraper_lock = threading.Lock()
+
+
+def _get_scraper():
+    global _SCRAPER
+    if _SCRAPER is None:
+        with _scraper_lock:
+            if _SCRAPER is None:
+                scraper = cloudscraper.create_scraper(
+                    browser={"browser": "chrome", "platform": "windows", "desktop": True}
+                )
+                scraper.headers.update(HEADERS)
+                _SCRAPER = scraper
+    return _SCRAPER
+
+
+def _validators(resp) -> Dict[str, str]:
+    # Conditional-GET headers to send next time, from this response's cache validators
+    out = {}
+    etag = resp.headers.get("ETag")
+    if etag:
+        out["If-None-Match"] = etag
+    last_modified = resp.headers.get("Last-Modified")
+    if last_modified:
+        out["If-Modified-Since"] = last_modified
+    return out
+
+
+def fetch_tribute_html(
+    conditional: Optional[Dict[str, str]] = None,
+) -> Tuple[Optional[bytes], Optional[str], Optional[int], Optional[str], Dict[str, str]]:
+    """
+    Returns (html, error, status, final_url, validators).
 
+    conditional holds If-None-Match / If-Modified-Since from a previous fetch;
+    a 304 comes back as status 304 with html None and no error.
+    """
     last_err = None
     last_status = None
     last_url = None
 
     for _attempt in range(1, 4):
         try:
-            resp = scraper.get(
+            resp = _get_scraper().get(
                 TRIBUTE_THEATRE_URL,
-                headers=HEADERS,
-                timeout=25,
+                headers=conditional,
+                timeout=(5, 25),  # (connect, read): fail fast on a dead host
                 allow_redirects=True,
             )
             last_status = resp.status_code
             last_url = resp.url
 
+            if resp.status_code == 304 and conditional:
+                return None, None, 304, resp.url, {}
+
             if resp.status_code != 200:
                 last_err = f"HTTP {resp.status_code}"
                 continue
 
-            text = resp.text or ""
-            if len(text) < 1000:
-                last_err = f"HTML too short (len={len(text)}) likely blocked"
+            # Raw bytes: the parser decodes them itself, skipping requests'
+            # charset sniffing over the whole body.
+            raw = resp.content or b""
+            if len(raw) < 1000:
+                last_err = f"HTML too short (len={len(raw)}) likely blocked"
                 continue
 
-            return text, None, resp.status_code, resp.url
+            return raw, None, resp.status_code, resp.url, _validators(resp)
 
         except Exception as e:
             last_err = f"ScraperError: {str(e)}"
 
-    return None, (last_err or "Unknown fetch failure"), last_status, last_url
+    return None, (last_err or "Unknown fetch failure"), last_status, last_url, {}
+
 
+# One pass over the raw page walks the tags the old soup lookup used, in
+# document order: <div> open/close (to know when we are inside a .media-body
+# or .ticketicons block), <h2> headings and <b> labels. Movie headings are
+# h2.media-heading (or, on pages without any, h2 inside .media-body); date
+# labels only count inside the .ticketicons block that follows a heading.
+_RE_PAGE_TAGS = re.compile(
+    rb"<div\b(?P<div>[^>]*)>|</div\s*>"
+    rb"|<h2\b(?P<h2>[^>]*)>(?P<title>.*?)</h2\s*>"
+    rb"|<b\b[^>]*>(?P<label>.*?)</b\s*>",
+    re.DOTALL | re.IGNORECASE,
+)
+_RE_CLASS_ATTR = re.compile(rb"""\bclass\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.IGNORECASE)
+_RE_MEDIA_HEADING = re.compile(
+    rb"""<h2\b[^>]*\bclass\s*=\s*["']?[^"'>]*\bmedia-heading\b""", re.IGNORECASE
+)
+# <meta charset="..."> or <meta http-equiv=... content="text/html; charset=...">
+_RE_META_CHARSET = re.compile(rb"""<meta\b[^>]*?charset\s*=\s*["']?([\w.:-]+)""", re.IGNORECASE)
+_RE_TAG = re.compile(rb"<[^>]*>")
+_RE_SPACES = re.compile(r"\s+")
+
+
+def _classes(attrs: bytes) -> List[bytes]:
+    m = _RE_CLASS_ATTR.search(attrs)
+    if not m:
+        return []
+    return (m.group(1) or m.group(2) or m.group(3) or b"").lower().split()
+
+
+def _page_charset(html: bytes) -> str:
+    # The page's own <meta> declaration, as a browser (or lxml) would honour
+    # it; UTF-8 when it declares none or names an unknown codec.
+    m = _RE_META_CHARSET.search(html, 0, 4096)
+    if m:
+        name = m.group(1).decode("ascii", "replace")
+        try:
+            return codecs.lookup(name).name
+        except LookupError:
+            pass
+    return "utf-8"
 
-def parse_tribute_schedule(html: str) -> Dict[str, Dict]:
-    soup = BeautifulSoup(html, "html.parser")
-    today = date.today()
+
+def _tag_text(inner: bytes, encoding: str = "utf-8") -> str:
+    # Inner HTML of a matched tag -> its text, pieces joined by single spaces
+    if b"<" in inner:
+        inner = _RE_TAG.sub(b" ", inner)
+    text = inner.decode(encoding, "replace")
+    if "&" in text:
+        text = unescape(text)
+    return _RE_SPACES.sub(" ", text).strip()
+
+
+def _label_date(inner: bytes) -> Optional[Tuple[int, int]]:
+    # Most <b> text is showtimes or notes with no comma; reject those on the raw
+    # bytes before paying for decoding and tag stripping. Labels are ASCII, so
+    # the page charset doesn't matter here.
+    if b"," not in inner:
+        return None
+    return _parse_date_label(_tag_text(inner))
+
+
+def parse_tribute_schedule(html: bytes, today: Optional[date] = None) -> Dict[str, Dict]:
+    # Local (theatre) day, the same one build_schedule windows on
+    today = today or now_local().date()
+    today_ord = today.toordinal()
     movie_spans: Dict[str, Dict] = {}
+    encoding = _page_charset(html)
+    # Same preference as the old select("h2.media-heading") or select(".media-body h2")
+    by_class = _RE_MEDIA_HEADING.search(html) is not None
+
+    # Open <div>s as (is .ticketicons, is .media-body), plus how many of each
+    # are open right now
+    divs: List[Tuple[bool, bool]] = []
+    in_tickets = 0
+    in_media_body = 0
+
+    # Heading whose ticket block is still to come (or open)
+    current: Optional[Tuple[str, str]] = None
+    for match in _RE_PAGE_TAGS.finditer(html):
+        div_attrs = match.group("div")
+        if div_attrs is not None:
+            classes = _classes(div_attrs)
+            flags = (b"ticketicons" in classes, b"media-body" in classes)
+            divs.append(flags)
+            in_tickets += flags[0]
+            in_media_body += flags[1]
+            continue
 
-    headers = soup.select("h2.media-heading") or soup.select(".media-body h2")
-    if not headers:
-        return {}
+        h2_attrs = match.group("h2")
+        if h2_attrs is not None:
+            if by_class:
+                is_heading = b"media-heading" in _classes(h2_attrs)
+            else:
+                is_heading = in_media_body > 0
+            if not is_heading:
+                continue  # sidebar/section <h2>s don't start or end a movie
+            current = None
+            title = _tag_text(match.group("title"), encoding)
+            if len(title) < 2 or title.lower() in _SKIP_HEADINGS:
+                continue
+            current = (_intern_title(normalize_title(title)), _intern_title(title))
+            continue
 
-    for h2 in headers:
-        title = h2.get_text(" ", strip=True)
-        if not title or len(title) < 2:
+        label = match.group("label")
+        if label is None:
+            # </div>: leaving a ticket block ends its heading's dates
+            if divs:
+                tickets, media_body = divs.pop()
+                in_tickets -= tickets
+                in_media_body -= media_body
+                if tickets and not in_tickets:
+                    current = None
             continue
 
-        lowered = title.lower()
-        if lowered in ("regular showtimes", "showtimes", "coming soon"):
+        if current is None or not in_tickets:
+            continue
+        parsed = _label_date(label)
+        if not parsed:
             continue
 
-        norm = normalize_title(title)
-
-        media_div = h2.find_parent("div", class_="media")
-        ticket_div = None
-
-        if media_div:
-            sib = media_div
-            for _ in range(0, 8):
-                sib = sib.find_next_sibling()
-                if sib is None:
-                    break
-                if getattr(sib, "name", None) == "div" and "ticketicons" in (sib.get("class") or []):
-                    ticket_div = sib
-                    break
-
-        if ticket_div:
-            info = movie_spans.setdefault(norm, {"display_title": title, "dates": set()})
-            for b in ticket_div.find_all("b"):
-                raw = b.get_text(" ", strip=True)
-                m = DATE_LABEL_RE.match(raw)
-                if not m:
-                    continue
-
-                month = MONTHS.get(m.group(2))
-                day_num = int(m.group(3))
-                if not month:
-                    continue
-
-                year = _guess_year(today, month, day_num)
-                try:
-                    info["dates"].add(date(year, month, day_num))
-                except ValueError:
-                    continue
+        norm, title = current
+        info = movie_spans.get(norm)
+        if info is None:
+            # Title keys are derived once per scrape, not per request
+            info = movie_spans[norm] = {
+                "display_title": title,
+                "norm": norm,
+                "poster_key": _poster_cache_key(title),
+                "dates": [],  # raw (month, day) labels until the post-pass below
+            }
+        info["dates"].append(parsed)
+
+    # Resolve years once per distinct label, then keep a sorted, deduped list
+    for info in movie_spans.values():
+        dates = set()
+        for month, day_num in set(info["dates"]):
+            try:
+                dates.add(date(_guess_year(today_ord, month, day_num), month, day_num))
+            except ValueError:
+                continue
+        info["dates"] = sorted(dates)
+        info["ords"] = [d.toordinal() for d in info["dates"]]  # bisect keys for build_schedule
 
     return movie_spans
 
 
-def build_schedule(days_ahead: int, spans: Dict[str, Dict]) -> List[dict]:
-    today = date.today()
-    horizon = today + timedelta(days=days_ahead)
+@dataclass(slots=True)
+class MovieOut:
+    # One /api/showtimes entry; orjson serializes it field by field, in this order
+    title: str
+    norm: str
+    first_date: date
+    last_date: date
+    dates: List[date]  # actual listed days only
+    days_until_start: int
+    run_length_days: int
+    poster_url: Optional[str] = None
+
+
+def build_schedule(days_ahead: int, spans: Dict[str, Dict], today: Optional[date] = None) -> List[MovieOut]:
+    today = today or now_local().date()
+    today_ord = today.toordinal()
+    lower_ord = today_ord - 7
+    horizon_ord = today_ord + days_ahead
     result = []
 
-    for _norm, info in spans.items():
-        dates_set = info.get("dates") or set()
-        lower = today - timedelta(days=7)
-
-        filtered = sorted([d for d in dates_set if lower <= d <= horizon])
-        if not filtered:
+    for info in spans.values():
+        # Dates and their ordinals are stored sorted, so the window is one
+        # contiguous slice found by bisection. Real date objects go out;
+        # orjson writes them as ISO strings at encode time.
+        ords = info["ords"]
+        lo = bisect_left(ords, lower_ord)
+        hi = bisect_right(ords, horizon_ord, lo)
+        if lo == hi:
             continue
-
-        first, last = filtered[0], filtered[-1]
-        result.append({
-            "title": info.get("display_title") or "Untitled",
-            "first_date": first.isoformat(),
-            "last_date": last.isoformat(),
-            "dates": [d.isoformat() for d in filtered],  # actual listed days only
-            "days_until_start": (first - today).days,
-            "run_length_days": len(filtered),
-        })
-
-    result.sort(key=lambda x: (x["days_until_start"], x["run_length_days"], x["title"]))
+        filtered = info["dates"][lo:hi]
+
+        result.append(MovieOut(
+            title=info.get("display_title") or "Untitled",
+            norm=info["norm"],
+            first_date=filtered[0],
+            last_date=filtered[-1],
+            dates=filtered,
+            days_until_start=ords[lo] - today_ord,
+            run_length_days=hi - lo,
+        ))
+
+    result.sort(key=attrgetter("days_until_start", "run_length_days", "title"))
     return result
 
 
 # ------------ APP LOGIC ------------
 
-_cache = {
-    "fetched_at": None,
-    "spans": None,
-    "fetch_error": None,
-    "fetch_status": None,
-    "fetch_url": None,
-    "html_len": None,
-}
+@dataclass(slots=True)
+class CacheState:
+    fetched_at: Optional[datetime] = None
+    spans: Optional[Dict[str, Dict]] = None
+    fetch_error: Optional[str] = None
+    fetch_status: Optional[int] = None
+    fetch_url: Optional[str] = None
+    html_len: int = 0
+    # If-None-Match / If-Modified-Since for the next fetch of the same page
+    validators: Dict[str, str] = field(default_factory=dict)
+    # (day parsed, body digest) behind `spans`, for servers that ignore validators
+    parsed_key: Optional[Tuple[int, bytes]] = None
+    # days -> (day built, spans it was built from, JSON body, ETag, gzipped body)
+    response_bytes: Dict[int, Tuple[Any, ...]] = field(default_factory=dict)
 
 
-def get_cached_spans() -> Tuple[Optional[Dict[str, Dict]], Optional[str]]:
-    now = now_local()
+_cache = CacheState()
+
+_DEBUG_KEYS = ("fetched_at", "fetch_error", "fetch_status", "fetch_url", "html_len")
 
-    if _cache["fetched_at"] and _cache["spans"]:
-        age = (now - _cache["fetched_at"]).total_seconds()
+
+def _cache_debug() -> Dict:
+    return {k: getattr(_cache, k) for k in _DEBUG_KEYS}
+
+
+# Single-flight refresh: one thread fetches, the rest wait for its result
+_cache_lock = threading.Lock()
+_refresh_done: Optional[threading.Event] = None
+REFRESH_WAIT_SECONDS = 30
+
+
+def _fresh_spans(now: datetime) -> Optional[Dict[str, Dict]]:
+    if _cache.fetched_at and _cache.spans:
+        age = (now - _cache.fetched_at).total_seconds()
         if age < CACHE_TTL_SECONDS:
-            return _cache["spans"], None
-
-    html, err, status, final_url = fetch_tribute_html()
-    _cache.update({
-        "fetched_at": now,
-        "fetch_error": err,
-        "fetch_status": status,
-        "fetch_url": final_url,
-        "html_len": len(html) if html else 0,
-    })
+            return _cache.spans
+    return None
+
+
+def _refresh_spans(now: datetime) -> Tuple[Optional[Dict[str, Dict]], Optional[str]]:
+    # Only revalidate when there are spans to fall back on
+    conditional = _cache.validators if _cache.spans else None
+    html, err, status, final_url, validators = fetch_tribute_html(conditional)
+    _cache.fetched_at = now
+    _cache.fetch_error = err
+    _cache.fetch_status = status
+    _cache.fetch_url = final_url
+
+    if status == 304 and _cache.spans:
+        # Page unchanged: keep the spans and the encoded responses built from them
+        return _cache.spans, None
+
+    _cache.html_len = len(html) if html else 0
 
     if not html:
+        log.warning("Tribute fetch failed (status=%s): %s", status, err)
+        # Stale-on-error: a slightly old schedule beats a 503
+        if _cache.spans:
+            return _cache.spans, None
         return None, (err or "Fetch failed")
 
-    spans = parse_tribute_schedule(html)
-    _cache["spans"] = spans
+    # Same body on the same day parses to the same spans (the year guess is
+    # the only date-dependent part), so reuse them and their encoded responses
+    today = now.date()
+    parsed_key = (today.toordinal(), hashlib.blake2b(html, digest_size=16).digest())
+    if parsed_key == _cache.parsed_key and _cache.spans:
+        _cache.validators = validators
+        return _cache.spans, None
+
+    spans = parse_tribute_schedule(html, today)
+    log.info("Parsed %d titles from %d bytes", len(spans), len(html))
+    _cache.spans = spans
+    _cache.validators = validators
+    _cache.parsed_key = parsed_key
+    _cache.response_bytes = {}
+    try:
+        _schedule_save(spans, validators)
+    except sqlite3.Error:
+        pass  # disk copy is best effort; memory already has the new spans
     return spans, None
 
 
-def _poster_cache_get(key: str) -> Optional[Dict]:
-    v = _poster_cache.get(key)
-    if not v:
-        return None
-    if (time.time() - v.get("ts", 0)) > POSTER_CACHE_TTL_SECONDS:
-        _poster_cache.pop(key, None)
-        return None
-    return v
+def get_cached_spans(force: bool = False) -> Tuple[Optional[Dict[str, Dict]], Optional[str]]:
+    global _refresh_done
+    now = now_local()
 
+    spans = None if force else _fresh_spans(now)
+    if spans:
+        return spans, None
+
+    if not force and _cache.spans:
+        # Stale-while-revalidate: a request holding any spans (stale, or
+        # restored from disk) answers now; a background thread pays for the
+        # fetch. Only callers with nothing to serve wait below.
+        _revalidate_in_background()
+        return _cache.spans, None
+
+    with _cache_lock:
+        spans = None if force else _fresh_spans(now)
+        if spans:
+            return spans, None
+        done = _refresh_done
+        leader = done is None
+        if leader:
+            done = _refresh_done = threading.Event()
+
+    if not leader:
+        done.wait(timeout=REFRESH_WAIT_SECONDS)
+        if _cache.spans:
+            return _cache.spans, None
+        return None, (_cache.fetch_error or "Fetch failed")
 
-def _poster_cache_set(key: str, payload: Dict) -> None:
+    try:
+        return _refresh_spans(now)
+    finally:
+        with _cache_lock:
+            _refresh_done = None
+        done.set()
+
+
+_revalidating = False
+
+
+def _revalidate_in_background() -> None:
+    global _revalidating
+    with _cache_lock:
+        if _revalidating or _refresh_done is not None:
+            return  # a refresh is already on its way
+        _revalidating = True
+
+    def run() -> None:
+        global _revalidating
+        try:
+            get_cached_spans(force=True)
+        except Exception:
+            log.exception("Background revalidation failed")
+        finally:
+            _revalidating = False
+
+    threading.Thread(target=run, name="spans-revalidate", daemon=True).start()
+
+
+_refresher_started = False
+
+
+def _refresh_loop() -> None:
+    # Ticks every half TTL, timed from each refresh's start, so even a slow
+    # fetch lands well before the spans it replaces go stale
+    interval = CACHE_TTL_SECONDS / 2
+    while True:
+        started = time.monotonic()
+        try:
+            spans, _err = get_cached_spans(force=True)
+            if spans:
+                start_poster_warm(spans)
+        except Exception:
+            # keep the thread alive; the next tick retries
+            log.exception("Background refresh failed")
+        elapsed = time.monotonic() - started
+        time.sleep(max(1.0, interval - elapsed - random.uniform(0, REFRESH_JITTER_SECONDS)))
+
+
+def start_background_refresh() -> None:
+    """Starts the refresher thread once per process (idempotent)."""
+    global _refresher_started
+    if _refresher_started or not BACKGROUND_REFRESH:
+        return
+    with _cache_lock:
+        if _refresher_started:
+            return
+        _refresher_started = True
+    threading.Thread(target=_refresh_loop, name="spans-refresh", daemon=True).start()
+
+
+def _init_poster_db(conn: sqlite3.Connection) -> None:
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS posters ("
+        "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, payload TEXT NOT NULL)"
+    )
+    # Last parsed schedule (single row) so a restart can revalidate instead of re-scraping
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS schedule ("
+        "id INTEGER PRIMARY KEY CHECK (id = 1), validators TEXT NOT NULL, spans BLOB NOT NULL)"
+    )
+    conn.commit()
+
+
+def _open_poster_db() -> sqlite3.Connection:
+    conn = None
+    try:
+        os.makedirs(os.path.dirname(POSTER_CACHE_PATH) or ".", exist_ok=True)
+        # connect() opens lazily; a corrupt or unreadable file only fails here
+        conn = sqlite3.connect(POSTER_CACHE_PATH, check_same_thread=False)
+        _init_poster_db(conn)
+        return conn
+    except (OSError, sqlite3.Error):
+        # Read-only, corrupt or odd filesystem: still cache, just not across restarts
+        if conn is not None:
+            conn.close()
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        _init_poster_db(conn)
+        return conn
+
+
+_poster_db = _open_poster_db()
+_poster_db_lock = threading.Lock()
+
+
+def _poster_cache_get(key: str) -> Optional[Dict]:
+    try:
+        with _poster_db_lock:
+            row = _poster_db.execute(
+                "SELECT expires_at, payload FROM posters WHERE key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            if time.time() > row[0]:
+                _poster_db.execute("DELETE FROM posters WHERE key = ?", (key,))
+                _poster_db.commit()
+                return None
+    except sqlite3.Error:
+        return None  # locked/full/broken disk: treat as a miss
+    return json.loads(row[1])
+
+
+def _poster_cache_set(key: str, payload: Dict, ttl: float = POSTER_CACHE_TTL_SECONDS) -> None:
     payload = dict(payload)
     payload["ts"] = time.time()
-    _poster_cache[key] = payload
+    try:
+        with _poster_db_lock:
+            _poster_db.execute(
+                "INSERT OR REPLACE INTO posters (key, expires_at, payload) VALUES (?, ?, ?)",
+                (key, payload["ts"] + ttl, json.dumps(payload)),
+            )
+            _poster_db.commit()
+    except sqlite3.Error:
+        pass  # best effort: the lookup result still goes out
+
+
+def _schedule_save(spans: Dict[str, Dict], validators: Dict[str, str]) -> None:
+    blob = orjson.dumps(spans)
+    with _poster_db_lock:
+        _poster_db.execute(
+            "INSERT OR REPLACE INTO schedule (id, validators, spans) VALUES (1, ?, ?)",
+            (json.dumps(validators), blob),
+        )
+        _poster_db.commit()
+
+
+def _schedule_load() -> Tuple[Optional[Dict[str, Dict]], Dict[str, str]]:
+    with _poster_db_lock:
+        row = _poster_db.execute("SELECT validators, spans FROM schedule WHERE id = 1").fetchone()
+    if not row:
+        return None, {}
+    try:
+        spans = orjson.loads(row[1])
+        for info in spans.values():
+            info["dates"] = [date.fromisoformat(d) for d in info["dates"]]
+            info["ords"] = [d.toordinal() for d in info["dates"]]
+        return spans, json.loads(row[0])
+    except (ValueError, KeyError, TypeError, AttributeError):
+        # Unreadable row (older layout, partial write): just scrape fresh
+        return None, {}
+
+
+# Restored spans count as stale: the first refresh revalidates them with a
+# conditional GET, and they back the stale-on-error path until then.
+_cache.spans, _cache.validators = _schedule_load()
+
+
+# Shared TMDB session: the poster workers reuse pooled keep-alive connections
+# instead of opening a fresh TLS connection per search.
+_tmdb_session = requests.Session()
+_tmdb_session.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=POSTER_LOOKUP_WORKERS,
+        pool_maxsize=POSTER_LOOKUP_WORKERS,
+        max_retries=Retry(total=2, backoff_factor=0.3),
+    ),
+)
 
 
 def _clean_title_for_search(title: str) -> str:
@@ -276,18 +745,34 @@ def _clean_title_for_search(title: str) -> str:
 
     # Remove common prefixes that will wreck search results
     # e.g., "The Metropolitan Opera: Cinderella Encore"
-    t = re.sub(r"^(The Metropolitan Opera:\s*)", "", t, flags=re.IGNORECASE)
+    t = _RE_MET_OPERA.sub("", t)
 
     # Remove "Encore" tag (often not in TMDB title)
-    t = re.sub(r"\bEncore\b", "", t, flags=re.IGNORECASE).strip()
+    t = _RE_ENCORE.sub("", t).strip()
 
     return t
 
 
-def tmdb_search_best_poster(title: str) -> Dict:
+def _poster_cache_key(title: str) -> str:
+    # Same key tmdb_search_best_poster uses (normalized search query)
+    return normalize_title(_clean_title_for_search(title))
+
+
+def _tmdb_score(item: Dict) -> Tuple[int, float]:
+    # Prefer movies, then tv. Prefer higher popularity if available.
+    mt = item.get("media_type")
+    has_poster = 1 if item.get("poster_path") else 0
+    type_bonus = 2 if mt == "movie" else (1 if mt == "tv" else 0)
+    pop = float(item.get("popularity") or 0.0)
+    return (has_poster * 10 + type_bonus, pop)
+
+
+def tmdb_search_best_poster(title: str, cache_key: Optional[str] = None) -> Dict:
     """
     Returns:
       { ok, poster_url, tmdb_id, media_type, matched_title, error }
+
+    cache_key may be passed when the caller already has _poster_cache_key(title).
     """
     if not TMDB_API_KEY:
         return {"ok": False, "poster_url": None, "error": "TMDB_API_KEY not set"}
@@ -296,7 +781,7 @@ def tmdb_search_best_poster(title: str) -> Dict:
     if not q:
         return {"ok": False, "poster_url": None, "error": "Empty title"}
 
-    cache_key = normalize_title(q)
+    cache_key = cache_key or normalize_title(q)
     cached = _poster_cache_get(cache_key)
     if cached:
         return cached
@@ -311,35 +796,28 @@ def tmdb_search_best_poster(title: str) -> Dict:
             "language": "en-US",
             "page": 1
         }
-        r = requests.get(url, params=params, timeout=10)
+        r = _tmdb_session.get(url, params=params, timeout=(3.05, 10))
         if r.status_code != 200:
-            payload = {"ok": False, "poster_url": None, "error": f"TMDB HTTP {r.status_code}"}
-            _poster_cache_set(cache_key, payload)
+            # Only rate limits and server errors are worth retrying soon
+            transient = r.status_code == 429 or r.status_code >= 500
+            payload = {
+                "ok": False, "poster_url": None, "error": f"TMDB HTTP {r.status_code}", "retry": transient
+            }
+            _poster_cache_set(
+                cache_key, payload,
+                ttl=POSTER_ERROR_TTL_SECONDS if transient else POSTER_REJECTED_TTL_SECONDS,
+            )
             return payload
 
         data = r.json() or {}
         results = data.get("results") or []
 
         # Pick the best result with a poster_path
-        # Prefer movies, then tv. Prefer higher popularity if available.
-        def score(item: Dict) -> Tuple[int, float]:
-            mt = item.get("media_type")
-            has_poster = 1 if item.get("poster_path") else 0
-            type_bonus = 2 if mt == "movie" else (1 if mt == "tv" else 0)
-            pop = float(item.get("popularity") or 0.0)
-            return (has_poster * 10 + type_bonus, pop)
-
-        best = None
-        best_score = (-1, -1.0)
-        for it in results[:20]:
-            sc = score(it)
-            if sc > best_score and it.get("poster_path"):
-                best = it
-                best_score = sc
+        best = max((it for it in results[:20] if it.get("poster_path")), key=_tmdb_score, default=None)
 
         if not best:
             payload = {"ok": False, "poster_url": None, "error": "No TMDB match with poster"}
-            _poster_cache_set(cache_key, payload)
+            _poster_cache_set(cache_key, payload, ttl=POSTER_MISS_TTL_SECONDS)
             return payload
 
         poster_path = best.get("poster_path")
@@ -358,25 +836,130 @@ def tmdb_search_best_poster(title: str) -> Dict:
         return payload
 
     except Exception as e:
-        payload = {"ok": False, "poster_url": None, "error": f"TMDB error: {str(e)}"}
-        _poster_cache_set(cache_key, payload)
+        payload = {"ok": False, "poster_url": None, "error": f"TMDB error: {str(e)}", "retry": True}
+        _poster_cache_set(cache_key, payload, ttl=POSTER_ERROR_TTL_SECONDS)
         return payload
 
 
+def _poster_settled(payload: Dict) -> bool:
+    # Anything but a transient TMDB error (those expire and get retried)
+    return not payload.get("retry")
+
+
+def attach_posters(movies: List[MovieOut], spans: Dict[str, Dict]) -> bool:
+    """
+    Fills movie.poster_url in place from the poster cache only; TMDB lookups
+    run in the background (warm_posters). Returns False while any title is
+    unresolved or last failed transiently, so that body isn't kept.
+    """
+    settled = True
+    for m in movies:
+        m.poster_url = None
+        key = spans[m.norm]["poster_key"]
+        if not TMDB_API_KEY or not key:
+            continue  # nothing to look up (e.g. a title that cleans to "")
+        cached = _poster_cache_get(key)
+        if cached:
+            m.poster_url = cached.get("poster_url")
+            settled = settled and _poster_settled(cached)
+        else:
+            settled = False
+    return settled
+
+
+def warm_posters(spans: Dict[str, Dict]) -> None:
+    """Looks up every title missing from the poster cache, in parallel."""
+    if not TMDB_API_KEY:
+        return
+    missing = [
+        (info["display_title"], info["poster_key"])
+        for info in spans.values()
+        if info["poster_key"] and not _poster_cache_get(info["poster_key"])
+    ]
+    if not missing:
+        return
+
+    titles = [title for title, _key in missing]
+    keys = [key for _title, key in missing]
+    with ThreadPoolExecutor(max_workers=min(POSTER_LOOKUP_WORKERS, len(titles))) as ex:
+        list(ex.map(tmdb_search_best_poster, titles, keys))
+
+
+_poster_warm_lock = threading.Lock()
+_poster_warm_running = False
+
+
+def start_poster_warm(spans: Dict[str, Dict]) -> None:
+    """Runs warm_posters on a daemon thread unless one is already running."""
+    global _poster_warm_running
+    with _poster_warm_lock:
+        if _poster_warm_running:
+            return
+        _poster_warm_running = True
+
+    def run() -> None:
+        global _poster_warm_running
+        try:
+            warm_posters(spans)
+        except Exception:
+            log.exception("Poster warm-up failed")
+        finally:
+            _poster_warm_running = False
+
+    threading.Thread(target=run, name="poster-warm", daemon=True).start()
+
+
 app = Flask(__name__)
 
 
+def _json(obj, status: int = 200) -> Response:
+    # orjson encodes in native code and handles date/datetime directly
+    return Response(orjson.dumps(obj), status=status, mimetype="application/json")
+
+
+@app.before_request
+def _ensure_background_refresh():
+    # Started lazily so it runs inside the serving process (gunicorn worker)
+    start_background_refresh()
+
+
+@app.after_request
+def _gzip_response(resp: Response) -> Response:
+    if (
+        resp.status_code != 200
+        or resp.direct_passthrough
+        or resp.is_streamed
+        or "Content-Encoding" in resp.headers
+        or "gzip" not in request.headers.get("Accept-Encoding", "").lower()
+    ):
+        return resp
+
+    body = resp.get_data()
+    if len(body) < GZIP_MIN_BYTES:
+        return resp
+
+    resp.set_data(gzip.compress(body, compresslevel=6))
+    resp.headers["Content-Encoding"] = "gzip"
+    resp.vary.add("Accept-Encoding")
+
+    # The encoded bytes differ from the identity ones, so only a weak match holds
+    etag, weak = resp.get_etag()
+    if etag and not weak:
+        resp.set_etag(etag, weak=True)
+    return resp
+
+
 @app.route("/api/debug_raw")
 def api_debug_raw():
-    html, err, status, final_url = fetch_tribute_html()
-    return jsonify({
+    html, err, status, final_url, _ = fetch_tribute_html()
+    return _json({
         "ok": bool(html),
         "error": err,
         "status": status,
         "final_url": final_url,
         "len": len(html) if html else 0,
-        "has_media_heading": ("media-heading" in html if html else False),
-        "sample_head": html[:1000] if html else None
+        "has_media_heading": (b"media-heading" in html if html else False),
+        "sample_head": html[:1000].decode("utf-8", "replace") if html else None
     })
 
 
@@ -391,19 +974,57 @@ def api_showtimes():
 
     spans, err = get_cached_spans()
     if err or not spans:
-        return jsonify({
-            "generated_at": now_local().isoformat(),
+        return _json({
+            "generated_at": now_local(),
             "movies": [],
             "error": err,
-            "debug": _cache
-        }), 503
+            "debug": _cache_debug()
+        }, 503)
+
+    # Output only depends on (spans, days, today), so reuse the encoded body.
+    # One clock read per request: the window and generated_at agree on the day.
+    now = now_local()
+    today = now.date()
+    cached = _cache.response_bytes.get(days)
+    if cached and cached[0] == today and cached[1] is spans:
+        return _showtimes_response(*cached[2:])
+
+    movies = build_schedule(days, spans, today)
+    settled = attach_posters(movies, spans)
 
-    return jsonify({
-        "generated_at": now_local().isoformat(),
+    body = orjson.dumps({
+        "generated_at": now,
         "days_ahead": days,
-        "movies": build_schedule(days, spans),
+        "movies": movies,
         "source": "TributeMovies"
     })
+    etag = hashlib.md5(body, usedforsecurity=False).hexdigest()
+    # Compressed once per build rather than by _gzip_response on every hit
+    body_gz = gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_BYTES else None
+    if settled:
+        _cache.response_bytes[days] = (today, spans, body, etag, body_gz)
+    else:
+        # Posters still resolving: serve what the cache has, don't keep it,
+        # and let the background lookup fill in the rest for the next request
+        start_poster_warm(spans)
+    return _showtimes_response(body, etag, body_gz, cacheable=settled)
+
+
+def _showtimes_response(
+    body: bytes, etag: str, body_gz: Optional[bytes] = None, cacheable: bool = True
+) -> Response:
+    # Same freshness window as the server cache; answers 304 on If-None-Match
+    if body_gz is not None and "gzip" in request.headers.get("Accept-Encoding", "").lower():
+        resp = Response(body_gz, mimetype="application/json")
+        resp.headers["Content-Encoding"] = "gzip"
+        etag = f"{etag}-gzip"
+    else:
+        resp = Response(body, mimetype="application/json")
+    resp.vary.add("Accept-Encoding")
+    resp.set_etag(etag)
+    # A body still missing posters must not outlive the request in any cache
+    resp.headers["Cache-Control"] = f"public, max-age={CACHE_TTL_SECONDS}" if cacheable else "no-cache"
+    return resp.make_conditional(request)
 
 
 @app.route("/api/poster")
@@ -411,16 +1032,73 @@ def api_poster():
     # Example: /api/poster?title=Iron%20Lung
     title = (request.args.get("title") or "").strip()
     if not title:
-        return jsonify({"ok": False, "poster_url": None, "error": "Missing title"}), 400
+        return _json({"ok": False, "poster_url": None, "error": "Missing title"}, 400)
 
     payload = tmdb_search_best_poster(title)
-    return jsonify(payload)
+    return _json(payload)
+
+
+# Content-Encoding -> (body, ETag) of the rendered page, compressed once up
+# front; the page has no template variables
+_index_page: Optional[Dict[str, Tuple[bytes, str]]] = None
+
+
+def _build_index_page() -> Dict[str, Tuple[bytes, str]]:
+    body = render_template("index.html").encode("utf-8")
+    etag = hashlib.md5(body, usedforsecurity=False).hexdigest()
+    # Each encoding is its own representation, so each gets its own strong ETag
+    page = {
+        "identity": (body, etag),
+        "gzip": (gzip.compress(body, compresslevel=9), f"{etag}-gzip"),
+    }
+    if brotli is not None:
+        page["br"] = (brotli.compress(body, quality=11), f"{etag}-br")
+    return page
 
 
 @app.route("/")
 def index():
-    return render_template("index.html")
+    global _index_page
+    if _index_page is None or app.debug:  # debug keeps template edits live
+        _index_page = _build_index_page()
+
+    accept = request.headers.get("Accept-Encoding", "").lower()
+    encoding = "identity"
+    if "br" in accept and "br" in _index_page:
+        encoding = "br"
+    elif "gzip" in accept:
+        encoding = "gzip"
+
+    body, etag = _index_page[encoding]
+    resp = Response(body, mimetype="text/html")
+    if encoding != "identity":
+        resp.headers["Content-Encoding"] = encoding
+    resp.vary.add("Accept-Encoding")
+    resp.set_etag(etag)
+    # Revalidate every load (a deploy must reach browsers at once), but an
+    # unchanged page comes back as an empty 304
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=10000)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the Kalispell showtimes app.")
+    parser.add_argument("--dev", action="store_true", help="use Flask's single-process dev server")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    serve = None
+    if not args.dev:
+        try:
+            # Threaded WSGI server so slow poster lookups don't block other requests
+            from waitress import serve
+        except ImportError:
+            log.warning("waitress not installed; falling back to Flask's threaded dev server")
+
+    if serve is None:
+        app.run(host="0.0.0.0", port=10000, threaded=True)
+    else:
+        serve(app, host="0.0.0.0", port=10000, threads=8, connection_limit=1000)